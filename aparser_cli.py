@@ -3,11 +3,13 @@ import pathlib
 import writers
 
 from atop_reader import Facade
+from checkpoints import ErrorBudgetExceeded
 
 # Writers configuration
 supported_writers = {
     'csv': writers.CsvWriter,
-    'json': writers.JsonWriter
+    'json': writers.JsonWriter,
+    'ndjson': writers.NdjsonWriter,
 }
 
 # Parsing routine
@@ -15,49 +17,100 @@ parser = argparse.ArgumentParser(
     prog='aparser',
     description='Parses data from atop files to various formats')
 parser.add_argument('-t', "--target", help="path to atop log file or logs directory (no recursive)", default='', type=str)
-parser.add_argument('-o', "--out", help="output file path", default='', type=str)
-parser.add_argument('-of', "--out_format", help="output file format (csv, json)", default='csv', type=str)
+parser.add_argument('-o', "--out", help="output file path, optionally with format (out.ndjson:ndjson), "
+                                        "can be repeated to write several files in one pass",
+                    default=[], action='append', type=str)
+parser.add_argument('-of', "--out_format", help="output file format (csv, json, ndjson) for outputs without format "
+                                               "and known file extension, default: csv",
+                    default=None, type=str)
+parser.add_argument('-r', "--resume", help="continue interrupted conversion from its last checkpoint",
+                    action='store_true')
+parser.add_argument("--checkpoint_every", help="save checkpoint after every N written samples", default=100, type=int)
+parser.add_argument('-e', "--engine", help="pipeline engine: serial or process (stats process per CPU)",
+                    default='serial', choices=Facade.engines)
+parser.add_argument("--error_budget", help="number of bad samples to quarantine before aborting", default=0, type=int)
 
-args = parser.parse_args()
 
-if args.target == '':
-    parser.error('Must specify file or directory as target')
-    exit(1)
+def main():
+    args = parser.parse_args()
 
-if args.out == '':
-    parser.error('Must specify output file name')
-    exit(1)
+    if args.target == '':
+        parser.error('Must specify file or directory as target')
+        exit(1)
 
-formats_supported = list(supported_writers.keys())
-selected_format = args.out_format
-selected_format = formats_supported[0] if not selected_format else selected_format
+    if not args.out:
+        parser.error('Must specify output file name')
+        exit(1)
 
-formats_supported_text = ', '.join(formats_supported)
-if not selected_format in formats_supported:
-    parser.error(f'Format {args.out_format} is unsupported. Supported formats: {formats_supported_text}')
+    if args.checkpoint_every < 1:
+        parser.error('Checkpoint interval must be positive')
 
-path_to_target = pathlib.Path(args.target).absolute()
-path_to_out_file = pathlib.Path(args.out).absolute()
-out_format = selected_format
+    if args.error_budget < 0:
+        parser.error('Error budget must not be negative')
 
-print(f'Parsing: {path_to_target}\nTo: {path_to_out_file}\nFormat: {out_format}')
+    formats_supported = list(supported_writers.keys())
+    selected_format = args.out_format
+    selected_format = formats_supported[0] if not selected_format else selected_format
 
+    formats_supported_text = ', '.join(formats_supported)
+    if args.out_format and not args.out_format in formats_supported:
+        parser.error(f'Format {args.out_format} is unsupported. Supported formats: {formats_supported_text}')
+
+    # each output is 'path' or 'path:format'
+    sinks = list()
+    for out in args.out:
+        out_path, _, out_format = out.rpartition(':')
+        if not out_path or any(c in out_format for c in './\\'):
+            # format of output without format is taken from its known extension (out.ndjson), then from -of
+            out_path, out_format = out, selected_format
+            extension_format = pathlib.Path(out_path).suffix.lstrip('.').lower()
+            if extension_format in formats_supported:
+                if args.out_format and args.out_format != extension_format:
+                    parser.error(f'Output file {out_path} extension does not match format {args.out_format}, '
+                                 f'use {out_path}:{args.out_format} to write it anyway')
+                out_format = extension_format
+
+        if out_format not in formats_supported:
+            parser.error(f'Format {out_format} is unsupported. Supported formats: {formats_supported_text}')
+
+        path_to_out_file = pathlib.Path(out_path).absolute()
+        if path_to_out_file in [path for path, _ in sinks]:
+            parser.error(f'Output file {path_to_out_file} is specified more than once')
+        sinks.append((path_to_out_file, out_format))
+
+    path_to_target = pathlib.Path(args.target).absolute()
+
+    sinks_text = '\n'.join(f'To: {path} ({out_format})' for path, out_format in sinks)
+    print(f'Parsing: {path_to_target}\n{sinks_text}\nEngine: {args.engine}')
+
+    try:
+        f = Facade(engine=args.engine)
+        f.parse_resumable(src_file=path_to_target,
+                          sinks=sinks,
+                          resume=args.resume,
+                          checkpoint_every=args.checkpoint_every,
+                          error_budget=args.error_budget)
+    except ErrorBudgetExceeded as e:
+        # resume with the same budget stops at the same sample again
+        print('Too many bad samples!')
+        print(f'Details: {e}')
+        if Facade.checkpoint_path(sinks=sinks).exists():
+            print(f'Progress is saved, run the same command with --resume and --error_budget larger than '
+                  f'{args.error_budget} to quarantine bad samples')
+        else:
+            print(f'Run the same command with --error_budget larger than {args.error_budget} '
+                  f'to quarantine bad samples')
+    except Exception as e:
+        print('Somehow error occurred!')
+        print(f'Details: {e}')
+        if Facade.checkpoint_path(sinks=sinks).exists():
+            print('Progress is saved, run the same command with --resume to continue')
 
-def parse():
-    f = Facade()
-    if out_format == 'csv':
-        f.parse_to_csv(src_file=path_to_target, dst_file=path_to_out_file)
-    elif out_format == 'json':
-        f.parse_to_json(src_file=path_to_target, dst_file=path_to_out_file)
-    else:
-        print("There's no way this is going to happen.")
-        exit(1)
 
-try:
-    parse()
-except Exception as e:
-    print('Somehow error occurred!')
-    print(f'Details: {e}')
+# guard keeps process engine children, which import this module again on platforms that spawn processes,
+# from parsing arguments and running conversion again
+if __name__ == '__main__':
+    main()
 
 #
 # time_related_records = time_related_records_iterator(records=records)
@@ -20,8 +20,10 @@ positive_test() {
 #negative_test aparser_cli.py -t fff -o ooo -of txt
 #negative_test aparser_cli.py -t notexisting -o ooo -of csv
 #negative_test aparser_cli.py -t notexisting -o ooo -of json
+#negative_test aparser_cli.py -t fff -o ooo:txt
+#negative_test aparser_cli.py -t fff -o ooo -o ooo:json
+#negative_test aparser_cli.py -t fff -o ooo.ndjson -of csv
 
 # Real files test
-positive_test aparser_cli.py -t ./test_logs/web_stress -o ./test_results/web_stress.csv -of csv
-positive_test aparser_cli.py -t ./test_logs/web_stress -o ./test_results/web_stress.json -of json
+positive_test aparser_cli.py -t ./test_logs/web_stress -o ./test_results/web_stress.csv:csv -o ./test_results/web_stress.json:json
 #positive_test aparser_cli.py -t ./test_logs/web_stress -o ./test_results/web_stress_same.csv
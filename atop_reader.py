@@ -1,18 +1,23 @@
+import collections
 import datetime
+import heapq
+import itertools
+import json
+import multiprocessing
 import pathlib
+import traceback
+from queue import Empty
 from subprocess import Popen, PIPE
 from typing import Generator
 import loggers
-from parsers import CommonRecordParser, SpecialParsers
-from writers import CsvWriter, JsonWriter
+from checkpoints import Checkpoint, Quarantine
+from parsers import ChunkedRecordParser, RecordParser, SpecialParsers
+from writers import CsvWriter, FanOutWriter, JsonWriter, NdjsonWriter
 
 logger = loggers.LoggerFactory.get_logger(name=__name__)
 
 
-def records_iterator(path_to_target: pathlib.Path,
-                     record_types=('ALL',),
-                     binary='atop',
-                     parser: CommonRecordParser = None):
+def target_paths(path_to_target: pathlib.Path, skip_paths=()):
     if not path_to_target.exists():
         raise ValueError(f'Path not exists: {path_to_target} ')
 
@@ -24,29 +29,166 @@ def records_iterator(path_to_target: pathlib.Path,
         else:
             yield path_to_target
 
-    def lines(path):
-        p = Popen([binary, '-r', path, '-P', ','.join(record_types)], stdout=PIPE, encoding='utf8')
+    for current_path in paths():
+        # already converted files (see checkpoints) are not read again
+        if str(current_path) in skip_paths:
+            logger.info(f'Skipping already parsed file: {current_path}')
+            continue
 
-        # first 'RESET' line usually log reset not machine reboot, so we skip it
-        p.stdout.readline()
+        yield current_path
 
-        for raw_line in p.stdout:
-            if raw_line == 'RESET\n':
-                continue
 
-            if raw_line == 'SEP\n':
-                continue
+def atop_pipe(path: pathlib.Path,
+              record_types=('ALL',),
+              binary='atop',
+              encoding: str = None):
+    # atop output as text stream (with encoding) or as bytes stream
+    return Popen([binary, '-r', path, '-P', ','.join(record_types)], stdout=PIPE, encoding=encoding)
 
-            line = parser.parse(raw_line=raw_line)
-            yield line
 
+def first_epoch(path: pathlib.Path,
+                record_types=('ALL',),
+                binary='atop'):
+    # timestamp of the first sample, atop is stopped right after it (only one record type is requested)
+    p = atop_pipe(path=path, record_types=record_types[:1], binary=binary)
     try:
-        for current_path in paths():
-            lines_gen = lines(path=current_path)
-            for current_line in lines_gen:
-                yield current_line
-    except Exception as e:
-        raise e
+        for raw_line in p.stdout:
+            values = raw_line.split(maxsplit=3)
+            # 'RESET' and 'SEP' lines have no timestamp
+            if len(values) > 3:
+                return int(values[2])
+        return None
+    finally:
+        p.kill()
+        p.wait()
+
+
+def raw_lines_iterator(path: pathlib.Path,
+                       record_types=('ALL',),
+                       binary='atop'):
+    stdout = atop_pipe(path=path, record_types=record_types, binary=binary, encoding='utf8').stdout
+
+    # first 'RESET' line usually log reset not machine reboot, so we skip it
+    stdout.readline()
+
+    for raw_line in stdout:
+        if raw_line == 'RESET\n':
+            continue
+
+        if raw_line == 'SEP\n':
+            continue
+
+        yield raw_line
+
+
+def samples_iterator(items, epoch_of):
+    # groups consecutive items (records) with the same timestamp
+    for epoch, sample_items in itertools.groupby(items, key=epoch_of):
+        yield epoch, list(sample_items)
+
+
+def merge_samples(sources: list[tuple[int, str, object]],
+                  on_source_done=None):
+    # Streaming k-way merge of samples from several sources ordered by epoch.
+    # Each source is (first epoch, name, function creating samples iterator). Sources are opened lazily
+    # in order of first epoch, so only sources overlapping in time are read simultaneously,
+    # and only one pending sample per open source is kept in memory.
+    # Sample with the same epoch as the previous one (overlapping or rotated copies) is dropped,
+    # sample older than the previous one (clock stepped back) is kept with a warning.
+    pending = collections.deque(sorted(enumerate(sources), key=lambda x: (x[1][0], x[0])))
+    heap = list()
+
+    def advance(index, name, samples):
+        try:
+            epoch, items = next(samples)
+            heapq.heappush(heap, (epoch, index, items, name, samples))
+        except StopIteration:
+            if on_source_done is not None:
+                on_source_done(name)
+
+    last_epoch = None
+    while heap or pending:
+        while pending and (not heap or pending[0][1][0] <= heap[0][0]):
+            index, (_, name, open_samples) = pending.popleft()
+            advance(index=index, name=name, samples=open_samples())
+
+        if not heap:
+            continue
+
+        epoch, index, items, name, samples = heapq.heappop(heap)
+        if epoch == last_epoch:
+            logger.debug(f'{name}: dropping sample {epoch}, already yielded')
+        else:
+            if last_epoch is not None and epoch < last_epoch:
+                logger.warning(f'{name}: sample {epoch} is older than previous sample {last_epoch}')
+            last_epoch = epoch
+            yield epoch, items
+
+        # source is advanced only after its sample is consumed, so 'done' hook follows its last sample
+        advance(index=index, name=name, samples=samples)
+
+
+def target_samples(path_to_target: pathlib.Path,
+                   samples,
+                   record_types=('ALL',),
+                   binary='atop',
+                   skip_paths=(),
+                   skip_before_epoch: int = None,
+                   on_path_done=None):
+    # Samples of all files in target ordered by epoch (see merge_samples).
+    # `samples` creates (epoch, items) iterator for a file path.
+    paths = list(target_paths(path_to_target=path_to_target, skip_paths=skip_paths))
+
+    def source(path):
+        # single file needs no priming
+        epoch = first_epoch(path=path, record_types=record_types, binary=binary) if len(paths) > 1 else 0
+        return epoch, str(path), lambda: samples(path)
+
+    sources = list()
+    for current_source in (source(path) for path in paths):
+        if current_source[0] is not None:
+            sources.append(current_source)
+            continue
+
+        logger.warning(f'No samples found: {current_source[1]}')
+        if on_path_done is not None:
+            on_path_done(current_source[1])
+
+    merged_samples = merge_samples(sources=sources, on_source_done=on_path_done)
+    for epoch, items in merged_samples:
+        # samples older than given epoch are already converted (see checkpoints)
+        if skip_before_epoch is not None and epoch < skip_before_epoch:
+            continue
+        yield epoch, items
+
+
+def records_iterator(path_to_target: pathlib.Path,
+                     record_types=('ALL',),
+                     binary='atop',
+                     parser: RecordParser = None,
+                     skip_paths=(),
+                     skip_before_epoch: int = None,
+                     on_path_done=None):
+    def samples(path):
+        if isinstance(parser, ChunkedRecordParser):
+            stdout = atop_pipe(path=path, record_types=record_types, binary=binary).stdout
+            for epoch, raw_lines in parser.samples(stream=stdout):
+                yield epoch, [record for record in map(parser.parse, raw_lines) if record]
+            return
+
+        lines = (parser.parse(raw_line=raw_line)
+                 for raw_line in raw_lines_iterator(path=path, record_types=record_types, binary=binary))
+        yield from samples_iterator(items=lines, epoch_of=lambda record: int(record['epoch']))
+
+    target = target_samples(path_to_target=path_to_target,
+                            samples=samples,
+                            record_types=record_types,
+                            binary=binary,
+                            skip_paths=skip_paths,
+                            skip_before_epoch=skip_before_epoch,
+                            on_path_done=on_path_done)
+    for _, records in target:
+        yield from records
 
 
 def time_related_records_iterator(records: Generator[dict, None, None]):
@@ -85,6 +227,7 @@ class Stats:
         self.net_if_stats = None
 
         # initial data
+        self.epoch: int | None = None
         self.dt: datetime.datetime | None = None
         self.cpu: dict[str, str] | None = None
         self.cpus: list[dict[str, str]] | None = None
@@ -246,8 +389,11 @@ class Stats:
 
 
 class StatsSelector:
-    def __init__(self, time_related_records_iterator: Generator[object, None, None]):
+    def __init__(self,
+                 time_related_records_iterator: Generator[object, None, None],
+                 quarantine: Quarantine = None):
         self.time_related_records = time_related_records_iterator
+        self.quarantine = quarantine
 
     suffix_mapping = {
         "CPU_N": "proc_n",
@@ -269,28 +415,253 @@ class StatsSelector:
         while True:
             try:
                 epoch, records = next(self.time_related_records)
-                dt = datetime.datetime.fromtimestamp(epoch)
-                total_records_per_dt = len(records)
-                logger.debug(f'{dt} total records: {total_records_per_dt}')
-
-                named_records = dict([self.create_named_record(r) for r in records])
-
-                s: Stats = Stats()
-                s.dt = dt
-                s.cpu = named_records['CPU']
-                s.cpus = [r for r in records if r['record_type'] == 'CPU_N']
-                s.cpl = named_records['CPL']
-                s.mem = named_records['MEM']
-                s.swap = named_records['SWP']
-                s.disk_list = [r for r in records if r['record_type'] == 'DSK']
-                s.net = named_records['NET']
-                s.net_if_list = [r for r in records if r['record_type'] == 'NET_IF']
-                s.update()
-                yield s
-
             except StopIteration:
                 break
 
+            s = self.select(epoch=epoch, records=records)
+            if s is not None:
+                yield s
+
+    def select(self, epoch: int, records: list[dict]):
+        # stats of a single sample, None if the sample is quarantined
+        try:
+            return self.create_stats(epoch=epoch, records=records)
+        except (KeyError, ValueError, ZeroDivisionError) as e:
+            # incomplete or malformed sample (e.g. no SWP record on swapless host)
+            if self.quarantine is None:
+                raise e
+            self.quarantine.add(epoch=epoch, records=records, error=e)
+            return None
+
+    def create_stats(self, epoch: int, records: list[dict]):
+        dt = datetime.datetime.fromtimestamp(epoch)
+        total_records_per_dt = len(records)
+        logger.debug(f'{dt} total records: {total_records_per_dt}')
+
+        named_records = dict([self.create_named_record(r) for r in records])
+
+        s: Stats = Stats()
+        s.epoch = epoch
+        s.dt = dt
+        s.cpu = named_records['CPU']
+        s.cpus = [r for r in records if r['record_type'] == 'CPU_N']
+        s.cpl = named_records['CPL']
+        s.mem = named_records['MEM']
+        s.swap = named_records['SWP']
+        s.disk_list = [r for r in records if r['record_type'] == 'DSK']
+        s.net = named_records['NET']
+        s.net_if_list = [r for r in records if r['record_type'] == 'NET_IF']
+        s.update()
+        return s
+
+
+# Process engine.
+# Reader process merges atop output into samples and labels them like time_related_records_iterator does.
+# Samples are sent to stats processes as raw atop lines (one bytes blob per sample), each stats process
+# parses its samples and calculates stats independently, so the records are never pickled.
+# Processes are connected by bounded queues (backpressure) and exchange numbered batches of events:
+#   ('path_done', path)                       - file boundary, forwarded in order to the main process
+#   ('sample', (epoch, raw_lines))            - raw atop lines of a sample joined by newline (reader -> stats)
+#   ('row', (epoch, row))                     - flat stats row (stats -> main)
+#   ('quarantine', (epoch, records, error))   - sample that failed stats calculation (stats -> main)
+#   ('error', details)                        - process failure, stops the pipeline
+# Stats process answers each batch with a batch of the same number, main process restores their order.
+# None is the end of stream. Process that exits without ending its stream (e.g. killed) fails the pipeline:
+# main process watches exit codes of all processes, stats processes watch the reader.
+class _BatchSender:
+    def __init__(self, queue: multiprocessing.Queue, batch_size: int):
+        self.queue = queue
+        self.batch_size = batch_size
+        self.batch = list()
+        self.seq = 0
+
+    def send(self, kind: str, payload):
+        self.batch.append((kind, payload))
+        if len(self.batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.batch:
+            self.queue.put((self.seq, self.batch))
+            self.seq += 1
+            self.batch = list()
+
+    def close(self, receivers: int):
+        self.flush()
+        for _ in range(receivers):
+            self.queue.put(None)
+
+
+def _get(queue: multiprocessing.Queue, failure, timeout=1.0):
+    # Waits for queue item while `failure` gives no error message.
+    # Failure is checked before waiting, so items sent before sender's exit are still received.
+    while True:
+        error = failure()
+        try:
+            return queue.get(timeout=timeout)
+        except Empty:
+            if error is not None:
+                raise RuntimeError(error)
+
+
+def _ordered_events(queue: multiprocessing.Queue, senders: int, failure):
+    # events of numbered batches in order until every sender ends its stream
+    batches = dict()
+    next_seq = 0
+    while senders:
+        item = _get(queue=queue, failure=failure)
+        if item is None:
+            senders -= 1
+            continue
+
+        seq, batch = item
+        batches[seq] = batch
+        while next_seq in batches:
+            for kind, payload in batches.pop(next_seq):
+                if kind == 'error':
+                    raise RuntimeError(payload)
+                yield kind, payload
+            next_seq += 1
+
+
+def _reader_stage(out_queue: multiprocessing.Queue,
+                  workers: int,
+                  batch_size: int,
+                  path_to_target: pathlib.Path,
+                  record_types,
+                  binary: str,
+                  parser: ChunkedRecordParser,
+                  skip_paths,
+                  skip_before_epoch: int,
+                  alive):
+    # `alive` is write end of a pipe that is never written, it is closed on exit (see _stats_stage)
+    sender = _BatchSender(queue=out_queue, batch_size=batch_size)
+
+    def samples(path):
+        stdout = atop_pipe(path=path, record_types=record_types, binary=binary).stdout
+        return parser.samples(stream=stdout)
+
+    try:
+        target = target_samples(path_to_target=path_to_target,
+                                samples=samples,
+                                record_types=record_types,
+                                binary=binary,
+                                skip_paths=skip_paths,
+                                skip_before_epoch=skip_before_epoch,
+                                on_path_done=lambda path: sender.send('path_done', path))
+
+        # sample is labelled with the timestamp of the next one, the last sample is dropped
+        # (see time_related_records_iterator)
+        pending = None
+        for epoch, raw_lines in target:
+            if pending is not None:
+                sender.send('sample', (epoch, pending))
+            pending = b'\n'.join(raw_lines)
+    except Exception:
+        sender.send('error', traceback.format_exc())
+    sender.close(receivers=workers)
+
+
+class _QuarantineForwarder:
+    # collects quarantined samples of a batch, main process adds them to the real quarantine
+    def __init__(self):
+        self.events = list()
+
+    def add(self, epoch: int, records: list[dict], error: Exception):
+        self.events.append(('quarantine', (epoch, records, error)))
+
+
+def _stats_stage(in_queue: multiprocessing.Queue,
+                 out_queue: multiprocessing.Queue,
+                 parser: ChunkedRecordParser,
+                 with_quarantine: bool,
+                 reader_alive):
+    forwarder = _QuarantineForwarder()
+    stats_selector = StatsSelector(time_related_records_iterator=None,
+                                   quarantine=forwarder if with_quarantine else None)
+
+    # end of file on `reader_alive` pipe means reader process has exited
+    def reader_failure():
+        return 'Reader process exited without ending samples stream' if reader_alive.poll() else None
+
+    for seq, batch in iter(lambda: _get(queue=in_queue, failure=reader_failure), None):
+        # batch is answered with a new list, the previous one may still be pickled by queue feeder thread
+        events = forwarder.events = list()
+        try:
+            for kind, payload in batch:
+                if kind != 'sample':
+                    events.append((kind, payload))
+                    continue
+
+                epoch, raw_lines = payload
+                records = [record for record in map(parser.parse, raw_lines.split(b'\n')) if record]
+                s = stats_selector.select(epoch=epoch, records=records)
+                if s is not None:
+                    events.append(('row', (s.epoch, s.to_dict_flat())))
+        except Exception:
+            events.append(('error', traceback.format_exc()))
+        out_queue.put((seq, events))
+
+    out_queue.put(None)
+
+
+def process_rows_iterator(path_to_target: pathlib.Path,
+                          record_types=('ALL',),
+                          binary='atop',
+                          parser: ChunkedRecordParser = None,
+                          skip_paths=(),
+                          skip_before_epoch: int = None,
+                          on_path_done=None,
+                          quarantine: Quarantine = None,
+                          workers: int = None,
+                          batch_size=64,
+                          queue_size=8):
+    workers = workers or multiprocessing.cpu_count()
+    samples_queue = multiprocessing.Queue(maxsize=queue_size * workers)
+    rows_queue = multiprocessing.Queue(maxsize=queue_size * workers)
+
+    reader_alive, reader_alive_writer = multiprocessing.Pipe(duplex=False)
+
+    reader = multiprocessing.Process(target=_reader_stage,
+                                     name='aparser-reader',
+                                     args=(samples_queue, workers, batch_size, path_to_target, record_types,
+                                           binary, parser, skip_paths, skip_before_epoch, reader_alive_writer),
+                                     daemon=True)
+    reader.start()
+    # only the reader keeps write end open, so stats processes get end of file once it exits
+    reader_alive_writer.close()
+
+    processes = [reader]
+    processes.extend(multiprocessing.Process(target=_stats_stage,
+                                             name=f'aparser-stats-{i}',
+                                             args=(samples_queue, rows_queue, parser, quarantine is not None,
+                                                   reader_alive),
+                                             daemon=True) for i in range(workers))
+    for process in processes[1:]:
+        process.start()
+
+    def failure():
+        for process in processes:
+            if process.exitcode not in (None, 0):
+                return f'Process {process.name} exited with code {process.exitcode}'
+        return None
+
+    try:
+        for kind, payload in _ordered_events(queue=rows_queue, senders=workers, failure=failure):
+            if kind == 'row':
+                yield payload
+            elif kind == 'path_done' and on_path_done is not None:
+                on_path_done(payload)
+            elif kind == 'quarantine':
+                epoch, records, error = payload
+                quarantine.add(epoch=epoch, records=records, error=error)
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+        reader_alive.close()
+
 
 class Facade:
     special_parsers = [
@@ -307,36 +678,223 @@ class Facade:
     # These types are only parsed from atop output
     types_to_parse = ['CPU', 'cpu', 'CPL', 'MEM', 'SWP', 'NET', 'DSK']
 
-    def _create_stats_generator(self, src_file: pathlib.Path):
-        common_parser = CommonRecordParser(special_parsers=self.special_parsers)
+    # 'serial' runs whole pipeline in current process, 'process' reads samples and calculates stats
+    # in separate processes (stats process per CPU)
+    engines = ('serial', 'process')
+
+    # Output formats written while parsing, csv needs all rows for its header
+    streamed_formats = ('json', 'ndjson')
+
+    def __init__(self, engine='serial'):
+        if engine not in self.engines:
+            raise ValueError(f'Unsupported engine: {engine}')
+        self.engine = engine
+
+    def _create_parser(self):
+        # bytes-level chunked parser, CommonRecordParser with the same special parsers gives the same records
+        return ChunkedRecordParser(special_parsers=self.special_parsers)
 
+    def _create_stats_generator(self,
+                                src_file: pathlib.Path,
+                                skip_paths=(),
+                                skip_before_epoch: int = None,
+                                on_path_done=None,
+                                quarantine: Quarantine = None):
         records = records_iterator(path_to_target=src_file,
                                    record_types=self.types_to_parse,
-                                   parser=common_parser)
+                                   parser=self._create_parser(),
+                                   skip_paths=skip_paths,
+                                   skip_before_epoch=skip_before_epoch,
+                                   on_path_done=on_path_done)
 
         time_related_records = time_related_records_iterator(records=records)
 
-        stats_selector = StatsSelector(time_related_records_iterator=time_related_records)
+        stats_selector = StatsSelector(time_related_records_iterator=time_related_records,
+                                       quarantine=quarantine)
         stats_generator = stats_selector.stats_generator()
 
         return stats_generator
 
+    def _create_rows_generator(self,
+                               src_file: pathlib.Path,
+                               skip_paths=(),
+                               skip_before_epoch: int = None,
+                               on_path_done=None,
+                               quarantine: Quarantine = None):
+        # yields (epoch, flat stats row) pairs using selected engine
+        if self.engine == 'process':
+            return process_rows_iterator(path_to_target=src_file,
+                                         record_types=self.types_to_parse,
+                                         parser=self._create_parser(),
+                                         skip_paths=skip_paths,
+                                         skip_before_epoch=skip_before_epoch,
+                                         on_path_done=on_path_done,
+                                         quarantine=quarantine)
+
+        stats_generator = self._create_stats_generator(src_file=src_file,
+                                                       skip_paths=skip_paths,
+                                                       skip_before_epoch=skip_before_epoch,
+                                                       on_path_done=on_path_done,
+                                                       quarantine=quarantine)
+        return ((stats.epoch, stats.to_dict_flat()) for stats in stats_generator)
+
+    @staticmethod
+    def _create_writer(dst_file: pathlib.Path, out_format: str):
+        # function writing iterable of rows to file
+        if out_format == 'csv':
+            return lambda rows: CsvWriter().write_csv(path=dst_file, rows=rows)
+        elif out_format == 'json':
+            return lambda rows: JsonWriter().write_json(path=dst_file, dict_rows=rows)
+        elif out_format == 'ndjson':
+            return lambda rows: NdjsonWriter().write_ndjson(path=dst_file, dict_rows=rows)
+        else:
+            raise ValueError(f'Unsupported output format: {out_format}')
+
+    def _write_rows(self, sinks: list[tuple[pathlib.Path, str]], rows):
+        # every sink (output file, format) gets rows from the same single pass
+        writers = [self._create_writer(dst_file=dst_file, out_format=out_format) for dst_file, out_format in sinks]
+        FanOutWriter(writers=writers).write(rows=rows)
+
+    def parse_to(self,
+                 src_file: pathlib.Path,
+                 sinks: list[tuple[pathlib.Path, str]]):
+        rows_generator = self._create_rows_generator(src_file=src_file)
+        self._write_rows(sinks=sinks, rows=(row for _, row in rows_generator))
+
     def parse_to_csv(self,
                      src_file: pathlib.Path,
                      dst_file: pathlib.Path):
-        stats_generator = self._create_stats_generator(src_file=src_file)
-        csv_writer = CsvWriter()
-        dict_rows = [x.to_dict_flat() for x in stats_generator]
-        csv_writer.write_csv(path=dst_file, rows=dict_rows)
+        self.parse_to(src_file=src_file, sinks=[(dst_file, 'csv')])
 
     def parse_to_json(self,
                       src_file: pathlib.Path,
                       dst_file: pathlib.Path):
-        stats_generator = self._create_stats_generator(src_file=src_file)
+        self.parse_to(src_file=src_file, sinks=[(dst_file, 'json')])
 
-        json_writer = JsonWriter()
-        rows = [stat.to_dict_flat() for stat in stats_generator]
-        json_writer.write_json(path=dst_file, dict_rows=rows)
+    @staticmethod
+    def checkpoint_path(sinks: list[tuple[pathlib.Path, str]]):
+        # checkpoint of resumable conversion is '<first sink file>.checkpoint', it exists only if there is
+        # progress to resume from
+        dst_file = sinks[0][0]
+        return dst_file.with_name(f'{dst_file.name}.checkpoint')
+
+    def parse_resumable(self,
+                        src_file: pathlib.Path,
+                        sinks: list[tuple[pathlib.Path, str]],
+                        resume=False,
+                        checkpoint_every=100,
+                        error_budget=0):
+        # Rows are spooled to '<dst>.partial' (one JSON per line) and progress is saved to '<dst>.checkpoint',
+        # so failed conversion can be continued from the last checkpoint instead of starting over.
+        # Samples that can not be calculated go to '<dst>.quarantine' until error budget is exhausted.
+        # Streamed sinks (json, ndjson) get rows while parsing, after resume they are rewritten starting with
+        # rows from spool. Other sinks (csv) are written from spool once all sources are parsed.
+        # '<dst>' is the first sink file.
+        # Side files are kept after a failure only if some progress was made (see checkpoint_path).
+        # Sinks and target are checked before any side file is created.
+        for dst_file, out_format in sinks:
+            self._create_writer(dst_file=dst_file, out_format=out_format)
+        list(target_paths(path_to_target=src_file))
+        streamed_sinks = [sink for sink in sinks if sink[1] in self.streamed_formats]
+        spooled_sinks = [sink for sink in sinks if sink[1] not in self.streamed_formats]
+
+        dst_file = sinks[0][0]
+        checkpoint_path = self.checkpoint_path(sinks=sinks)
+        spool_path = dst_file.with_name(f'{dst_file.name}.partial')
+        quarantine_path = dst_file.with_name(f'{dst_file.name}.quarantine')
+
+        checkpoint = None
+        if resume and checkpoint_path.exists():
+            checkpoint = Checkpoint.load(path=checkpoint_path)
+            if checkpoint.target != str(src_file):
+                raise ValueError(f'Checkpoint {checkpoint_path} was made for another target: {checkpoint.target}')
+            logger.info(f'Resuming from checkpoint: {len(checkpoint.files_done)} files done, '
+                        f'last epoch {checkpoint.last_epoch}, output offset {checkpoint.out_offset}')
+        elif resume:
+            logger.warning(f'Checkpoint {checkpoint_path} not found, starting from scratch')
+
+        if checkpoint is None:
+            checkpoint = Checkpoint(path=checkpoint_path, target=str(src_file))
+            spool_path.unlink(missing_ok=True)
+            quarantine_path.unlink(missing_ok=True)
+
+        # Sample is done when it is written to spool or quarantined. Files reported by records iterator
+        # are committed to checkpoint with the next done sample, because the last sample of a file
+        # is yielded only after the next sample is read.
+        finished_paths = list()
+
+        def sample_done(epoch: int):
+            checkpoint.files_done.extend(finished_paths)
+            finished_paths.clear()
+            checkpoint.last_epoch = epoch
+
+        def has_progress():
+            return checkpoint.last_epoch is not None or bool(checkpoint.files_done)
+
+        try:
+            quarantine = Quarantine(path=quarantine_path,
+                                    budget=error_budget,
+                                    errors=checkpoint.errors,
+                                    offset=checkpoint.quarantine_offset,
+                                    on_add=sample_done)
+
+            rows_generator = self._create_rows_generator(src_file=src_file,
+                                                         skip_paths=set(checkpoint.files_done),
+                                                         skip_before_epoch=checkpoint.last_epoch,
+                                                         on_path_done=finished_paths.append,
+                                                         quarantine=quarantine)
+
+            with open(spool_path.absolute(), 'ab') as spool:
+                spool.truncate(checkpoint.out_offset)
+
+                def save_checkpoint():
+                    spool.flush()
+                    checkpoint.errors = quarantine.errors
+                    checkpoint.quarantine_offset = quarantine.offset
+                    checkpoint.save()
+
+                def rows():
+                    # rows written before the checkpoint are read back before new rows are appended to spool
+                    with open(spool_path.absolute(), 'r', encoding='utf-8') as done_spool:
+                        yield from (json.loads(line) for line in done_spool)
+
+                    written = 0
+                    for epoch, row in rows_generator:
+                        row_bytes = f'{json.dumps(row, ensure_ascii=False)}\n'.encode('utf-8')
+                        spool.write(row_bytes)
+                        checkpoint.out_offset += len(row_bytes)
+                        sample_done(epoch=epoch)
+                        yield row
+
+                        written += 1
+                        if written % checkpoint_every == 0:
+                            save_checkpoint()
+
+                    checkpoint.files_done.extend(finished_paths)
+
+                try:
+                    self._write_rows(sinks=streamed_sinks, rows=rows())
+                finally:
+                    if has_progress():
+                        save_checkpoint()
+        except BaseException:
+            if not has_progress():
+                # failed before any sample or file was done, there is nothing to resume from
+                checkpoint.remove()
+                spool_path.unlink(missing_ok=True)
+                quarantine_path.unlink(missing_ok=True)
+            raise
+
+        if spooled_sinks:
+            with open(spool_path.absolute(), 'r', encoding='utf-8') as spool:
+                self._write_rows(sinks=spooled_sinks, rows=(json.loads(line) for line in spool))
+
+        checkpoint.remove()
+        spool_path.unlink()
+        if quarantine.errors:
+            logger.warning(f'{quarantine.errors} samples quarantined, see {quarantine_path}')
+        else:
+            quarantine_path.unlink()
 
 
 if __name__ == '__main__':
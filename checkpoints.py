@@ -0,0 +1,107 @@
+import json
+import os
+import pathlib
+import loggers
+
+logger = loggers.LoggerFactory.get_logger(name=__name__)
+
+
+class ErrorBudgetExceeded(Exception):
+    pass
+
+
+# Collects samples that failed stats calculation instead of aborting the run.
+# Each bad sample is appended to quarantine file as JSON line (epoch, error, raw records).
+# Bad sample that does not fit into `budget` raises ErrorBudgetExceeded.
+class Quarantine:
+    def __init__(self,
+                 path: pathlib.Path,
+                 budget: int = 0,
+                 errors: int = 0,
+                 offset: int = 0,
+                 on_add=None):
+        self.path = path
+        self.budget = budget
+        self.errors = errors
+        self.offset = offset
+        self.on_add = on_add
+
+        # drop entries written after the checkpoint this quarantine was restored from
+        with open(self.path.absolute(), 'ab') as quarantine_file:
+            quarantine_file.truncate(self.offset)
+
+    def add(self, epoch: int, records: list[dict], error: Exception):
+        # `epoch` is the one yielded by time_related_records_iterator (timestamp of the next sample),
+        # it is only passed to `on_add` for progress tracking, entry and messages use sample's own timestamp
+        sample_epoch = int(records[0]['epoch'])
+
+        # sample over budget is neither quarantined nor marked done,
+        # so resume with the same budget stops at the same sample
+        if self.errors + 1 > self.budget:
+            see_text = f', see {self.path}' if self.errors else ''
+            message = (f'Error budget exceeded: sample {sample_epoch} is bad ({error!r}), '
+                       f'{self.errors} samples already quarantined (budget {self.budget}){see_text}')
+            raise ErrorBudgetExceeded(message) from error
+
+        self.errors += 1
+        logger.warning(f'Sample {sample_epoch} quarantined ({self.errors}/{self.budget}): {error!r}')
+
+        entry = json.dumps({'epoch': sample_epoch, 'error': repr(error), 'records': records}, ensure_ascii=False)
+        entry_bytes = f'{entry}\n'.encode('utf-8')
+        with open(self.path.absolute(), 'ab') as quarantine_file:
+            quarantine_file.write(entry_bytes)
+        self.offset += len(entry_bytes)
+
+        if self.on_add is not None:
+            self.on_add(epoch)
+
+
+# Progress of a long conversion, enough to continue it after a failure:
+# files_done - atop files that were completely written to output
+# last_epoch - epoch of the last sample written to output or quarantined (samples are ordered by epoch)
+# out_offset - size of the output spool (bytes) consistent with the fields above
+# errors, quarantine_offset - number of quarantined samples and size of quarantine file (bytes)
+class Checkpoint:
+    def __init__(self, path: pathlib.Path, target: str = ''):
+        self.path = path
+        self.target = target
+        self.files_done: list[str] = list()
+        self.last_epoch: int | None = None
+        self.out_offset = 0
+        self.errors = 0
+        self.quarantine_offset = 0
+
+    @classmethod
+    def load(cls, path: pathlib.Path):
+        with open(path.absolute(), 'r', encoding='utf-8') as checkpoint_file:
+            d = json.load(checkpoint_file)
+
+        checkpoint = cls(path=path, target=d['target'])
+        checkpoint.files_done = d['files_done']
+        checkpoint.last_epoch = d['last_epoch']
+        checkpoint.out_offset = d['out_offset']
+        checkpoint.errors = d['errors']
+        checkpoint.quarantine_offset = d['quarantine_offset']
+        return checkpoint
+
+    def to_dict(self):
+        d = dict()
+        d['target'] = self.target
+        d['files_done'] = self.files_done
+        d['last_epoch'] = self.last_epoch
+        d['out_offset'] = self.out_offset
+        d['errors'] = self.errors
+        d['quarantine_offset'] = self.quarantine_offset
+        return d
+
+    def save(self):
+        # write to temporary file first so that crash during save never corrupts previous checkpoint
+        tmp_path = self.path.with_name(f'{self.path.name}.tmp')
+        with open(tmp_path.absolute(), 'w', encoding='utf-8') as checkpoint_file:
+            json.dump(self.to_dict(), checkpoint_file, indent=2)
+        os.replace(tmp_path, self.path)
+
+        logger.debug(f'Checkpoint saved: {self.to_dict()}')
+
+    def remove(self):
+        self.path.unlink(missing_ok=True)
@@ -2,6 +2,25 @@ import loggers
 
 logger = loggers.LoggerFactory.get_logger(name=__name__)
 
+# atop label -> (record type of 'upper' level stats, record type of other stats).
+# Record type is the name of special parser, labels not listed here are record types themselves.
+label_record_types = {
+    'cpu': ('CPU_N', 'CPU_N'),  # current cpu stats, 'CPU' label is overall cpu stats
+    'NET': ('NET', 'NET_IF'),  # network stats (first value is 'upper') or network interface stats
+}
+
+
+def record_type_of(label: str, first_value: str) -> str:
+    upper_type, other_type = label_record_types.get(label, (label, label))
+    return upper_type if first_value == 'upper' else other_type
+
+
+def label_of(record_type: str) -> str:
+    for label, record_types in label_record_types.items():
+        if record_type in record_types:
+            return label
+    return record_type
+
 
 class RecordParser:
     def parse(self, raw_line: str) -> dict:
@@ -15,12 +34,14 @@ class SpecialRecordParser(RecordParser):
 
     def parse(self, raw_line: str) -> dict:
         values = raw_line.split()
+        logger.debug(f'{self.name} schema names/values: {len(self.schema)}/{len(values)}')
+        return self.parse_values(values=values)
+
+    def parse_values(self, values: list[str]) -> dict:
         names = list(self.schema.keys())
 
         total_values = len(values)
         total_names = len(names)
-        logger.debug(f'{self.name} schema names/values: {total_names}/{total_values}')
-
         total = total_names if total_names <= total_values else total_values
 
         result = dict()
@@ -40,14 +61,8 @@ class CommonRecordParser(RecordParser):
             logger.warning(f'Can not parse: {ex}')
             return {}
 
-        # distinguish network stats from network interface stats
         first_raw_record = raw_records.split()[0]
-        if record_type == 'NET' and first_raw_record != 'upper':
-            record_type = 'NET_IF'
-
-        # distinguish overall cpu stats from current cpu stats
-        if record_type == 'cpu':
-            record_type = 'CPU_N'
+        record_type = record_type_of(label=record_type, first_value=first_raw_record)
 
         try:
             parser = self.mapping[record_type]
@@ -61,6 +76,87 @@ class CommonRecordParser(RecordParser):
         return result | raw_records_parsed
 
 
+class ChunkedRecordParser(RecordParser):
+    # Fast ingestion layer underneath special parsers.
+    # Reads atop output as bytes in large chunks, splits lines in bulk and dispatches on the record label
+    # before tokenization: lines with unknown labels ('RESET', 'SEP', types without special parser) are skipped.
+    # Only values described by schema are split and decoded, then handed to the special parser of the record type.
+    # Records are the same as CommonRecordParser gives with the same special parsers (see __main__ below).
+    def __init__(self, special_parsers: list[SpecialRecordParser], chunk_size=1024 * 1024):
+        self.chunk_size = chunk_size
+        self.mapping: dict[str, SpecialRecordParser] = {p.name: p for p in special_parsers}
+
+        # atop label -> max number of tokens to split (line header and the longest schema of its record types)
+        self.maxsplit: dict[bytes, int] = dict()
+        for p in special_parsers:
+            label = label_of(record_type=p.name).encode()
+            self.maxsplit[label] = max(self.maxsplit.get(label, 0), 6 + len(p.schema))
+
+    def chunks(self, stream):
+        # all lines of the stream, split in bulk chunk by chunk
+        tail = b''
+        while True:
+            chunk = stream.read(self.chunk_size)
+            if not chunk:
+                break
+
+            chunk_lines = (tail + chunk).split(b'\n')
+            tail = chunk_lines.pop()
+            yield chunk_lines
+
+        yield [tail]
+
+    def lines(self, stream):
+        labels = self.maxsplit
+        for chunk_lines in self.chunks(stream=stream):
+            for raw_line in chunk_lines:
+                if raw_line[:raw_line.find(b' ')] in labels:
+                    yield raw_line
+
+    def samples(self, stream):
+        # (epoch, raw lines) of every sample, atop ends each sample with 'SEP' line.
+        # Only the first line of a sample is tokenized to get its timestamp.
+        labels = self.maxsplit
+        sample = list()
+        for chunk_lines in self.chunks(stream=stream):
+            for raw_line in chunk_lines:
+                if raw_line[:raw_line.find(b' ')] in labels:
+                    sample.append(raw_line)
+                elif raw_line == b'SEP' and sample:
+                    yield int(sample[0].split(maxsplit=3)[2]), sample
+                    sample = list()
+
+        if sample:
+            yield int(sample[0].split(maxsplit=3)[2]), sample
+
+    def parse(self, raw_line: bytes) -> dict:
+        label = raw_line[:raw_line.find(b' ')]
+        try:
+            values = raw_line.split(maxsplit=self.maxsplit[label])
+        except KeyError:
+            return {}
+
+        if len(values) < 7:
+            logger.warning(f'Can not parse: {raw_line}')
+            return {}
+
+        record_type = record_type_of(label=label.decode(), first_value=values[6].decode())
+        parser = self.mapping.get(record_type)
+        if parser is None:
+            return {}
+
+        schema_values = [value.decode() for value in values[6:6 + len(parser.schema)]]
+
+        result = {'record_type': record_type, 'epoch': values[2].decode(), 'interval': values[5].decode()}
+        return result | parser.parse_values(values=schema_values)
+
+    def parse_stream(self, stream):
+        for raw_line in self.lines(stream=stream):
+            record = self.parse(raw_line=raw_line)
+            if record:
+                yield record
+
+
 class SpecialParsers:
     CPU = SpecialRecordParser(
         name='CPU',
@@ -199,6 +295,8 @@ class SpecialParsers:
 
 
 if __name__ == '__main__':
+    import io
+
     lines = [
         'CPU xxx 1741208401 2025/03/06 00:00:01 605594 100 1 221178 274283 19 59824907 26535 0 2628 8861 0 2399 100 0 0',
         'CPU xxx 1741209001 2025/03/06 00:10:01 300 100 1 124 155 0 29587 14 0 5 4 0 2399 100 0 0',
@@ -214,3 +312,38 @@ if __name__ == '__main__':
     for line in lines:
         print(crp.parse(raw_line=line))
 
+    # chunked parser must give the same records as common parser for every special parser
+    lines = [
+        'RESET',
+        'CPU xxx 1741209001 2025/03/06 00:10:01 300 100 2 124 155 0 29587 14 0 5 4 0 2399 100 0 0',
+        'cpu xxx 1741209001 2025/03/06 00:10:01 300 100 0 62 77 0 14793 7 0 2 2 0 2399 100 0 0',
+        'cpu xxx 1741209001 2025/03/06 00:10:01 300 100 1 62 78 0 14794 7 0 3 2 0 2399 100 0 0',
+        'CPL xxx 1741209001 2025/03/06 00:10:01 300 2 0.12 0.10 0.05 182734 98123',
+        'MEM xxx 1741209001 2025/03/06 00:10:01 300 4096 1000000 200000 300000 1000 50000 10 40000 0 0 0 0 2048 0 0',
+        'SWP xxx 1741209001 2025/03/06 00:10:01 300 4096 500000 490000 0 600000 1000000',
+        'NET xxx 1741209001 2025/03/06 00:10:01 300 upper 1 2 3 4 5 6 7 8 9 10 11 12 13 14 15 16',
+        'NET xxx 1741209001 2025/03/06 00:10:01 300 eth0 100 20000 90 18000 1000 1',
+        'DSK xxx 1741209001 2025/03/06 00:10:01 300 sda 1200 10 80 20 160 0 0 0 3',
+        'PRG xxx 1741209001 2025/03/06 00:10:01 300 1 (init) S 0 0 1',
+        'SEP',
+    ]
+
+    parsers = [
+        SpecialParsers.CPU,
+        SpecialParsers.CPU_N,
+        SpecialParsers.CPL,
+        SpecialParsers.MEM,
+        SpecialParsers.SWP,
+        SpecialParsers.NET,
+        SpecialParsers.NET_IF,
+        SpecialParsers.DSK,
+    ]
+    crp = CommonRecordParser(special_parsers=parsers)
+    chunked_parser = ChunkedRecordParser(special_parsers=parsers, chunk_size=64)
+
+    known_lines = [line for line in lines if line.split()[0] in ('CPU', 'cpu', 'CPL', 'MEM', 'SWP', 'NET', 'DSK')]
+    common_records = [crp.parse(raw_line=line) for line in known_lines]
+    stream = io.BytesIO('\n'.join(lines).encode())
+    chunked_records = list(chunked_parser.parse_stream(stream=stream))
+
+    print(f'Chunked parser records are the same as common parser records: {chunked_records == common_records}')
@@ -1,6 +1,9 @@
 import csv
 import json
 import pathlib
+import queue
+import threading
+from typing import Iterable
 
 
 class CsvWriter:
@@ -14,7 +17,10 @@ class CsvWriter:
 
     default_dialect = DefaultDialect()
 
-    def write_csv(self, path: pathlib.Path, rows: list[dict]):
+    def write_csv(self, path: pathlib.Path, rows: Iterable[dict]):
+        # all rows are needed to get generic fields before writing header
+        rows = list(rows)
+
         def get_generic_fields():
             # Some records can contain different set of fields (disks, network interfaces)
             # so all possible fields must be represented for csv write
@@ -40,6 +46,109 @@ class CsvWriter:
 class JsonWriter:
     def write_json(self,
                    path: pathlib.Path,
-                   dict_rows: list):
+                   dict_rows: Iterable[dict]):
+        # rows are written as they come, output is the same as json.dump of rows list with indent=2
         with open(path.absolute(), 'w', encoding='utf-8') as json_file:
-            json.dump(dict_rows, json_file, ensure_ascii=False, indent=2)
+            json_file.write('[')
+            separator = '\n'
+            for row in dict_rows:
+                row_json = json.dumps([row], ensure_ascii=False, indent=2)[2:-2]
+                json_file.write(f'{separator}{row_json}')
+                separator = ',\n'
+            json_file.write('\n]' if separator == ',\n' else ']')
+
+
+class NdjsonWriter:
+    def write_ndjson(self,
+                     path: pathlib.Path,
+                     dict_rows: Iterable[dict]):
+        with open(path.absolute(), 'w', encoding='utf-8') as ndjson_file:
+            for row in dict_rows:
+                ndjson_file.write(f'{json.dumps(row, ensure_ascii=False)}\n')
+
+
+class FanOutWriter:
+    # Feeds rows from one pass to several writers. Each writer consumes rows on its own thread
+    # from bounded queue (rows are passed in batches), so a slow writer does not stall rows producer
+    # until its queue is full.
+    def __init__(self, writers: list, queue_size=64, batch_size=256):
+        # writers - functions consuming iterable of rows
+        self.writers = writers
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+
+    def write(self, rows: Iterable[dict]):
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.writers]
+        errors = list()
+
+        def run(write, rows_queue: queue.Queue):
+            finished = False
+
+            def received_rows():
+                nonlocal finished
+                while (batch := rows_queue.get()) is not None:
+                    yield from batch
+                finished = True
+
+            try:
+                write(received_rows())
+            except Exception as e:
+                errors.append(e)
+
+            # failed (or not fully consuming) writer must not block the others
+            while not finished:
+                finished = rows_queue.get() is None
+
+        threads = [threading.Thread(target=run, args=(write, rows_queue), daemon=True)
+                   for write, rows_queue in zip(self.writers, queues)]
+        for thread in threads:
+            thread.start()
+
+        batch = list()
+        try:
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= self.batch_size:
+                    for rows_queue in queues:
+                        rows_queue.put(batch)
+                    batch = list()
+        finally:
+            # rows produced before `rows` failed still reach writers
+            if batch:
+                for rows_queue in queues:
+                    rows_queue.put(batch)
+            for rows_queue in queues:
+                rows_queue.put(None)
+            for thread in threads:
+                thread.join()
+
+        if errors:
+            raise errors[0]
+
+
+if __name__ == '__main__':
+    import tempfile
+
+    produced = list()
+
+    def failing_rows():
+        for i in range(300):
+            if i == 13:
+                raise ValueError(f'Bad row {i}')
+            row = {'row': i}
+            produced.append(row)
+            yield row
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path_to_ndjson = pathlib.Path(tmp_dir) / 'rows.ndjson'
+        fan_out_writer = FanOutWriter(writers=[lambda rows: NdjsonWriter().write_ndjson(path=path_to_ndjson,
+                                                                                        dict_rows=rows)])
+        try:
+            fan_out_writer.write(rows=failing_rows())
+        except ValueError as e:
+            print(f'Rows failed: {e}')
+
+        with open(path_to_ndjson.absolute(), 'r', encoding='utf-8') as ndjson_file:
+            written = [json.loads(line) for line in ndjson_file]
+
+    print(f'Rows written before failure are the same as produced rows: {written == produced}')